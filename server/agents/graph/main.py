@@ -2,6 +2,7 @@ import os
 import json
 import re
 import asyncio
+import logging
 from langchain_community.graphs import Neo4jGraph
 from langchain.prompts import FewShotPromptTemplate, PromptTemplate
 from langchain_groq import ChatGroq
@@ -10,6 +11,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Initialize components
 graph = Neo4jGraph(
     url=os.getenv("NEO4J_URI"),
@@ -26,13 +29,73 @@ llm = ChatGroq(
 
 memory = ConversationBufferMemory()
 
+# Inputs that end the conversation
+EXIT_WORDS = frozenset({"exit", "quit", "bye"})
+
+# Prompt pieces are constant, so build them once at import
+EXAMPLES = [
+    {"question": "How many diseases are there?", "query": "MATCH (d:Disease) RETURN count(d);"},
+    {"question": "Symptoms of COVID-19?", "query": "MATCH (s:Symptom)-[:SYMPTOM_OF]->(d:Disease {{name: 'COVID-19'}}) RETURN s.name;"},
+    {"question": "Drugs for Diabetes?", "query": "MATCH (d:Disease {{name: 'Diabetes'}})<-[:PRESCRIBED_FOR]-(drug:Drug) RETURN drug.name;"},
+]
+
+SCHEMA = """Node properties:
+Disease {name: STRING}, Symptom {name: STRING}, GeneticLinkage {name: STRING}, 
+CareInstruction {name: STRING}, Drug {name: STRING}, Treatment {name: STRING}, 
+SideEffect {name: STRING}.
+
+Relationships:
+(:Symptom)-[:SYMPTOM_OF]->(:Disease), 
+(:GeneticLinkage)-[:LINKED_TO]->(:Disease), 
+(:CareInstruction)-[:RECOMMENDED_FOR]->(:Disease), 
+(:Drug)-[:PRESCRIBED_FOR]->(:Disease), 
+(:Drug)-[:RECOMMENDED_DOSAGE]->(:Disease), 
+(:Treatment)-[:TREATS]->(:Disease), 
+(:Treatment)-[:USES_DRUG]->(:Drug), 
+(:Treatment)-[:HAS_SIDE_EFFECT]->(:SideEffect)."""
+
+EXAMPLE_PROMPT = PromptTemplate.from_template(
+    "User input: {question}\nCypher query: {query}"
+)
+
+CYPHER_PROMPT = FewShotPromptTemplate(
+    examples=EXAMPLES,
+    example_prompt=EXAMPLE_PROMPT,
+    prefix="""You are a Neo4j expert. Generate ONLY the Cypher query - no additional text or markdown. 
+
+Important rules:
+1. Always use single quotes for string values
+2. Always end queries with a semicolon
+3. Never include markdown code blocks
+4. Use correct relationship types from schema
+
+Schema:
+{schema}
+
+Examples:""",
+    suffix="User input: {question}\nCypher query:",
+    input_variables=["question", "schema"],
+)
+
+# Only the question varies, so render the few-shot prompt once around a marker
+_QUESTION_MARKER = "\x00question\x00"
+CYPHER_PROMPT_HEAD, CYPHER_PROMPT_TAIL = CYPHER_PROMPT.format(
+    question=_QUESTION_MARKER,
+    schema=SCHEMA
+).split(_QUESTION_MARKER)
+
+# Markdown code fence around generated Cypher; the closing fence may be missing
+CODE_FENCE_PATTERN = re.compile(r"```(?:cypher)?\s*(.*?)(?:```|$)", re.DOTALL | re.IGNORECASE)
+
+# Matches both {name: 'value'} and {{name: 'value'}} patterns
+ENTITY_NAME_PATTERN = re.compile(r"{{\s*name\s*:\s*['\"]([^'\"]+)['\"]\s*}}|{\s*name\s*:\s*['\"]([^'\"]+)['\"]\s*}")
+
+
 def clean_cypher_query(query: str) -> str:
     """Clean and validate Cypher queries"""
-    # Remove markdown code blocks if present
-    if query.startswith("```cypher"):
-        query = query[9:]  # Remove ```cypher
-    if query.endswith("```"):
-        query = query[:-3]  # Remove ```
+    # Keep only the body of a markdown code block, wherever it sits in the reply
+    if match := CODE_FENCE_PATTERN.search(query):
+        query = match.group(1)
     
     # Fix common syntax issues
     query = query.strip()
@@ -47,116 +110,69 @@ def clean_cypher_query(query: str) -> str:
 
 def execute_query_with_fuzzy_matching(graph, query):
     """Perform fuzzy matching on entity names before executing the query."""
-    print("\n=== 🛠️ Starting execute_query_with_fuzzy_matching ===")
-    print(f"Original query: {query}")
+    logger.debug("Fuzzy matching entities in query: %s", query)
     
     # Clean the query first
     query = clean_cypher_query(query)
     modified_query = query
     
-    # Match both {name: 'value'} and {{name: 'value'}} patterns
-    matches = re.finditer(r"{{\s*name\s*:\s*['\"]([^'\"]+)['\"]\s*}}|{\s*name\s*:\s*['\"]([^'\"]+)['\"]\s*}", query)
+    matches = ENTITY_NAME_PATTERN.finditer(query)
 
     for match in matches:
         # Use group 1 or group 2 depending on which pattern matched
         entity_name = match.group(1) if match.group(1) else match.group(2)
         entity_name = entity_name.strip()
-        print(f"🔍 Found entity name in query: '{entity_name}'")
+        logger.debug("Found entity name in query: '%s'", entity_name)
 
         fuzzy_match_query = f"""
             MATCH (n)
             WHERE apoc.text.levenshteinSimilarity(n.name, "{entity_name}") > 0.7
             RETURN n.name AS correctedName LIMIT 1
         """
-        print(f"Fuzzy match query:\n{fuzzy_match_query}")
-        
         result = graph.query(fuzzy_match_query)
-        print(f"Fuzzy match result: {result}")
+        logger.debug("Fuzzy match result for '%s': %s", entity_name, result)
 
         if result and result[0].get("correctedName"):
             corrected_name = result[0]["correctedName"]
             modified_query = modified_query.replace(entity_name, corrected_name)
-            print(f"✅ Corrected '{entity_name}' to '{corrected_name}'")
+            logger.debug("Corrected '%s' to '%s'", entity_name, corrected_name)
         else:
-            print(f"⚠ No fuzzy match found for '{entity_name}'. Proceeding with original.")
+            logger.debug("No fuzzy match found for '%s'; proceeding with original", entity_name)
 
-    print(f"Final query to execute: {modified_query}")
+    logger.debug("Final query to execute: %s", modified_query)
     try:
         query_result = graph.query(modified_query)
-        print(f"Query result: {query_result}")
-        print("=== 🛠️ Finished execute_query_with_fuzzy_matching ===")
+        logger.debug("Query result: %s", query_result)
         return query_result
     except Exception as e:
-        print(f"⚠️ Query execution failed: {str(e)}")
-        return None
+        logger.warning("Graph query execution failed: %s", e)
+        raise
 
 async def handle_query(user_question: str) -> str:
     """Handle medical graph queries programmatically for router integration"""
     try:
-        if user_question.lower() in ['exit', 'quit', 'bye']:
+        if user_question.lower() in EXIT_WORDS:
             memory.clear()
             return "Thank you for contacting Osaka University Hospital. Have a good day!"
             
-        examples = [
-            {"question": "How many diseases are there?", "query": "MATCH (d:Disease) RETURN count(d);"},
-            {"question": "Symptoms of COVID-19?", "query": "MATCH (s:Symptom)-[:SYMPTOM_OF]->(d:Disease {{name: 'COVID-19'}}) RETURN s.name;"},
-            {"question": "Drugs for Diabetes?", "query": "MATCH (d:Disease {{name: 'Diabetes'}})<-[:PRESCRIBED_FOR]-(drug:Drug) RETURN drug.name;"},
-        ]
-
-        schema = """Node properties:
-Disease {name: STRING}, Symptom {name: STRING}, GeneticLinkage {name: STRING}, 
-CareInstruction {name: STRING}, Drug {name: STRING}, Treatment {name: STRING}, 
-SideEffect {name: STRING}.
-
-Relationships:
-(:Symptom)-[:SYMPTOM_OF]->(:Disease), 
-(:GeneticLinkage)-[:LINKED_TO]->(:Disease), 
-(:CareInstruction)-[:RECOMMENDED_FOR]->(:Disease), 
-(:Drug)-[:PRESCRIBED_FOR]->(:Disease), 
-(:Drug)-[:RECOMMENDED_DOSAGE]->(:Disease), 
-(:Treatment)-[:TREATS]->(:Disease), 
-(:Treatment)-[:USES_DRUG]->(:Drug), 
-(:Treatment)-[:HAS_SIDE_EFFECT]->(:SideEffect)."""
-
-        example_prompt = PromptTemplate.from_template(
-            "User input: {question}\nCypher query: {query}"
-        )
-
-        prompt = FewShotPromptTemplate(
-            examples=examples,
-            example_prompt=example_prompt,
-            prefix="""You are a Neo4j expert. Generate ONLY the Cypher query - no additional text or markdown. 
-
-Important rules:
-1. Always use single quotes for string values
-2. Always end queries with a semicolon
-3. Never include markdown code blocks
-4. Use correct relationship types from schema
-
-Schema:
-{schema}
-
-Examples:""",
-            suffix="User input: {question}\nCypher query:",
-            input_variables=["question", "schema"],
-        )
-
         # Generate Cypher query
-        formatted_prompt = prompt.format(
-            question=user_question,
-            schema=schema
-        )
-        response = llm.invoke(formatted_prompt)
+        formatted_prompt = f"{CYPHER_PROMPT_HEAD}{user_question}{CYPHER_PROMPT_TAIL}"
+        # Awaited rather than blocking, so the router's loop keeps serving
+        # other callers and its time budget can cancel a hung call
+        response = await llm.ainvoke(formatted_prompt)
         
-        if not response or not hasattr(response, 'content'):
-            return "I couldn't generate a proper query for that question."
+        # An empty reply is a transient LLM failure, not an answer to cache
+        if not response.content:
+            raise RuntimeError("LLM returned no Cypher query")
 
         generated_query = response.content
-        print(f"\nGenerated query before cleaning: {generated_query}")
+        logger.debug("Generated query before cleaning: %s", generated_query)
         generated_query = clean_cypher_query(generated_query)
-        print(f"Cleaned query: {generated_query}")
 
-        query_result = execute_query_with_fuzzy_matching(graph, generated_query)
+        # The Neo4j driver is synchronous; run the queries in a thread
+        query_result = await asyncio.to_thread(
+            execute_query_with_fuzzy_matching, graph, generated_query
+        )
 
         if not query_result:
             return "I couldn't find any information about that in our database."
@@ -170,7 +186,7 @@ Results: {json.dumps(query_result, indent=2)}
 
 Response:"""
         
-        final_response = llm.invoke(response_prompt)
+        final_response = await llm.ainvoke(response_prompt)
         
         # Update conversation memory
         memory.chat_memory.add_user_message(user_question)
@@ -178,12 +194,14 @@ Response:"""
         
         return final_response.content
         
-    except Exception as e:
+    except Exception:
+        # Raised, not returned as text, so the router can tell a failure
+        # from an answer and never caches it
         memory.clear()
-        return f"⚠️ An error occurred: {str(e)}"
+        raise
 
 # Preserve original main for testing
-def main():
+async def main():
     """Standalone testing mode"""
     print("""
     ┌───────────────────────────────────────────────────────────────┐
@@ -197,7 +215,7 @@ def main():
         try:
             user_input = input("\nPatient: ").strip()
             
-            if user_input.lower() in ['exit', 'quit', 'bye']:
+            if user_input.lower() in EXIT_WORDS:
                 print("\nThank you for contacting Osaka University Hospital. Have a good day!")
                 break
                 
@@ -205,13 +223,16 @@ def main():
                 print("Please enter a valid question.")
                 continue
 
-            response = asyncio.run(handle_query(user_input))
+            response = await handle_query(user_input)
             print(f"\nAssistant: {response}")
             
         except KeyboardInterrupt:
             print("\n\nSession ended by user. Goodbye!")
             break
+        except Exception as e:
+            print(f"\n⚠️ An error occurred: {str(e)}")
+            continue
 
 if __name__ == "__main__":
     print("=== 🚀 Starting application ===")
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -6,11 +6,16 @@ import hashlib
 from datetime import datetime
 from supabase import create_client
 from dotenv import load_dotenv
-from typing import List, Dict
+from typing import List, Dict, Optional
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_cohere import CohereEmbeddings
 import asyncio
 
+try:
+    import uvloop
+except ImportError:  # uvloop is optional (and Unix-only); fall back to asyncio's loop
+    uvloop = None
+
 # Load environment variables
 load_dotenv()
 
@@ -21,6 +26,11 @@ embeddings = CohereEmbeddings(
 )
 supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
 
+EMBED_BATCH_SIZE = 32  # Cohere's max batch size
+EMBED_MAX_CONCURRENT = 4
+UPSERT_MAX_CONCURRENT = 4
+SELECT_PAGE_SIZE = 1000  # PostgREST's default row cap per request
+
 # Collection configurations
 COLLECTION_CONFIG = {
     "Department_Details": {
@@ -122,43 +132,87 @@ COLLECTION_CONFIG = {
     }
 }
 
+# Page numbers and confidentiality lines stripped from extracted text
+PAGE_NOISE_PATTERN = re.compile(r'Page \d+|^.*Confidential.*$', re.MULTILINE)
+
+# Each collection's auto-extracted metadata fields, compiled once
+AUTO_FIELD_PATTERNS = {
+    collection: tuple(
+        (field, re.compile(pattern, re.IGNORECASE))
+        for field, pattern in config["metadata_template"].get("auto_fields", {}).items()
+    )
+    for collection, config in COLLECTION_CONFIG.items()
+}
+
 def get_pdf_hash(pdf_path: str) -> str:
     """Generate hash for change detection"""
+    # Streamed in fixed-size blocks instead of reading the whole PDF;
+    # still MD5 so it matches the hashes already stored in Supabase
+    digest = hashlib.md5()
     with open(pdf_path, "rb") as f:
-        return hashlib.md5(f.read()).hexdigest()
+        while block := f.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
 
 def extract_text(pdf_path: str) -> str:
     """Extract and clean text from PDF"""
     with fitz.open(pdf_path) as doc:
         text = "\n".join([page.get_text().strip() for page in doc])
-    return re.sub(r'Page \d+|^.*Confidential.*$', '', text, flags=re.MULTILINE)
+    return PAGE_NOISE_PATTERN.sub('', text)
+
+# One splitter per collection, built on first use and shared by its PDFs
+_splitters: Dict[str, RecursiveCharacterTextSplitter] = {}
 
 def chunk_content(text: str, collection: str) -> List[str]:
     """Collection-specific chunking"""
-    config = COLLECTION_CONFIG[collection]
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=config["chunk_size"],
-        chunk_overlap=100,
-        separators=config["separators"]
-    )
+    splitter = _splitters.get(collection)
+    if splitter is None:
+        config = COLLECTION_CONFIG[collection]
+        splitter = _splitters[collection] = RecursiveCharacterTextSplitter(
+            chunk_size=config["chunk_size"],
+            chunk_overlap=100,
+            separators=config["separators"]
+        )
     return splitter.split_text(text)
 
-def generate_metadata(text: str, pdf_path: str, collection: str) -> Dict:
+def chunk_hash(text: str) -> str:
+    """Content hash stored with each chunk"""
+    return hashlib.md5(text.encode()).hexdigest()
+
+def fetch_stored_hashes(source_file: str) -> set:
+    """Content hashes of every chunk already stored for a PDF"""
+    hashes = set()
+    start = 0
+    while True:
+        page = (
+            supabase.table("hospital_documents")
+            .select("metadata->>content_hash")
+            .eq("metadata->>source_file", source_file)
+            .order("id")
+            .range(start, start + SELECT_PAGE_SIZE - 1)
+            .execute()
+        )
+        hashes.update(row["content_hash"] for row in page.data)
+        if len(page.data) < SELECT_PAGE_SIZE:
+            return hashes
+        start += SELECT_PAGE_SIZE
+
+def generate_metadata(text: str, source_file: str, collection: str, pdf_hash: str, processed_at: str) -> Dict:
     """Create metadata with auto-extracted fields"""
     config = COLLECTION_CONFIG[collection]
     metadata = config["metadata_template"].copy()
     
     # Auto-extract fields
-    for field, pattern in metadata.get("auto_fields", {}).items():
-        if match := re.search(pattern, text, re.IGNORECASE):
+    for field, pattern in AUTO_FIELD_PATTERNS[collection]:
+        if match := pattern.search(text):
             metadata[field] = match.group(1).lower()
     
     # Add standard fields
     metadata.update({
-        "source_file": os.path.basename(pdf_path),
-        "content_hash": hashlib.md5(text.encode()).hexdigest(),
-        "pdf_hash": get_pdf_hash(pdf_path),
-        "processed_at": datetime.now().isoformat()
+        "source_file": source_file,
+        "content_hash": chunk_hash(text),
+        "pdf_hash": pdf_hash,
+        "processed_at": processed_at
     })
     return {k: v for k, v in metadata.items() if v is not None}
 
@@ -167,73 +221,136 @@ async def generate_embeddings(texts: List[str], collection: str) -> List[List[fl
     input_type = COLLECTION_CONFIG[collection]
     return await embeddings.aembed_documents(texts)
 
-def upsert_to_supabase(data: List[Dict]):
+async def upsert_to_supabase(data: List[Dict], slots: Optional[asyncio.Semaphore] = None):
     """Batch upsert to Supabase"""
+    # The client is synchronous; each batch's request runs in a worker
+    # thread, so the batches are sent together, a bounded number at a time
+    # (shared across PDFs when the caller passes its semaphore)
     batch_size = 100  # Supabase limit
-    for i in range(0, len(data), batch_size):
-        batch = data[i:i + batch_size]
-        supabase.table("hospital_documents").upsert(batch).execute()
+    if slots is None:
+        slots = asyncio.Semaphore(UPSERT_MAX_CONCURRENT)
+
+    async def upsert(batch: List[Dict]):
+        async with slots:
+            await asyncio.to_thread(supabase.table("hospital_documents").upsert(batch).execute)
 
-async def process_pdf(pdf_path: str, collection: str):
+    await asyncio.gather(*[upsert(data[i:i + batch_size]) for i in range(0, len(data), batch_size)])
+
+async def process_pdf(pdf_path: str, collection: str, slots: Optional[asyncio.Semaphore] = None,
+                      upsert_slots: Optional[asyncio.Semaphore] = None):
     """End-to-end PDF processing pipeline"""
     print(f"Processing {pdf_path} for {collection}...")
     
     # Check if PDF was already processed
-    current_hash = get_pdf_hash(pdf_path)
-    existing = supabase.table("hospital_documents") \
-        .select("id") \
-        .eq("metadata->>source_file", os.path.basename(pdf_path)) \
-        .eq("metadata->>pdf_hash", current_hash) \
-        .execute()
+    source_file = os.path.basename(pdf_path)
+    # File reads, PDF parsing and Supabase calls block, so they run in
+    # worker threads while other PDFs make progress
+    current_hash = await asyncio.to_thread(get_pdf_hash, pdf_path)
+    existing = await asyncio.to_thread(
+        supabase.table("hospital_documents")
+        .select("id")
+        .eq("metadata->>source_file", source_file)
+        .eq("metadata->>pdf_hash", current_hash)
+        .limit(1)  # existence is all that matters, not every chunk's id
+        .execute
+    )
     
     if len(existing.data) > 0:
         print(f"✓ Already processed {pdf_path}")
         return
     
     # Process PDF
-    text = extract_text(pdf_path)
-    chunks = chunk_content(text, collection)
+    text = await asyncio.to_thread(extract_text, pdf_path)
+    # Repeated boilerplate (headers, footers, notices) would otherwise be
+    # embedded and stored once per occurrence
+    chunks = list(dict.fromkeys(chunk_content(text, collection)))
+
+    # A changed PDF only needs its new chunks embedded; chunks already
+    # stored from an earlier version are recognised by content hash
+    stored_hashes = await asyncio.to_thread(fetch_stored_hashes, source_file)
+    if stored_hashes:
+        chunks = [chunk for chunk in chunks if chunk_hash(chunk) not in stored_hashes]
+        if not chunks:
+            print(f"✓ No new chunks in {pdf_path}")
+            return
     
-    # Process in batches to avoid API limits
-    results = []
-    for i in range(0, len(chunks), 32):  # Cohere's max batch size
-        batch = chunks[i:i + 32]
-        batch_embeddings = await generate_embeddings(batch, collection)
-        
-        for chunk, embedding in zip(batch, batch_embeddings):
-            results.append({
-                "content": chunk,
-                "embedding": embedding,
-                "metadata": generate_metadata(chunk, pdf_path, collection)
-            })
+    # Process in batches to avoid API limits; the batches are embedded
+    # concurrently, a bounded number at a time (shared across PDFs when
+    # the caller passes its semaphore)
+    processed_at = datetime.now().isoformat()
+    batches = [chunks[i:i + EMBED_BATCH_SIZE] for i in range(0, len(chunks), EMBED_BATCH_SIZE)]
+    if slots is None:
+        slots = asyncio.Semaphore(EMBED_MAX_CONCURRENT)
+
+    async def embed(batch: List[str]) -> List[List[float]]:
+        async with slots:
+            return await generate_embeddings(batch, collection)
+
+    all_embeddings = await asyncio.gather(*[embed(batch) for batch in batches])
+
+    # Rows built in one pass, pairing each chunk with its vector
+    embedded = zip(chunks, (vector for vectors in all_embeddings for vector in vectors))
+    results = [
+        {
+            "content": chunk,
+            "embedding": embedding,
+            "metadata": generate_metadata(chunk, source_file, collection, current_hash, processed_at)
+        }
+        for chunk, embedding in embedded
+    ]
     
     # Save to Supabase
-    upsert_to_supabase(results)
+    await upsert_to_supabase(results, upsert_slots)
     print(f"✓ Saved {len(results)} chunks from {pdf_path}")
 
+# (filename marker, collection, case-insensitive), checked in order
+PDF_COLLECTIONS = (
+    ("Department", "Department_Details", False),
+    ("Consulting", "General_Consulting", False),
+    ("Payment", "Payments_and_Billing", False),
+    ("Billing", "Payments_and_Billing", False),
+    ("Principles", "Principles_Policies", False),
+    ("Information", "Outpatients_Policies", False),
+    ("Outpatient", "Outpatients_Policies", False),
+    ("admitted", "Admission_Discharge", True),
+    ("Patient Safety", "Patient_Safety_Policy", False),
+)
+
+def collection_for(filename: str) -> Optional[str]:
+    """Collection a PDF belongs to, from the markers in its filename"""
+    lowered = filename.lower()
+    for marker, collection, ignore_case in PDF_COLLECTIONS:
+        if marker in (lowered if ignore_case else filename):
+            return collection
+    return None
+
 async def main():
     # Example usage - process all PDFs in a folder
     # Try one of these:
     PDF_DIR = r"D:\FYP\client\public"  # Absolute path
+    jobs = []
     for filename in os.listdir(PDF_DIR):
         if filename.endswith(".pdf"):
-            # Map filename to collection
-            if "Department" in filename:
-                collection = "Department_Details"
-            elif "Consulting" in filename:
-                collection = "General_Consulting"
-            elif "Payment" in filename or "Billing" in filename:
-                collection = "Payments_and_Billing"
-            elif "Principles" in filename:
-                collection = "Principles_Policies"
-            elif "Information" in filename or "Outpatient" in filename:
-                collection = "Outpatients_Policies"
-            elif "admitted" in filename.lower():
-                collection = "Admission_Discharge"
-            elif "Patient Safety" in filename:
-                collection = "Patient_Safety_Policy"
-            
-            await process_pdf(os.path.join(PDF_DIR, filename), collection)
+            collection = collection_for(filename)
+            if collection is None:
+                print(f"Skipping {filename}: no matching collection")
+                continue
+            jobs.append((os.path.join(PDF_DIR, filename), collection))
+
+    # PDFs are processed together; shared semaphores bound their combined
+    # embedding and upsert requests, and a failed PDF doesn't stop the others
+    slots = asyncio.Semaphore(EMBED_MAX_CONCURRENT)
+    upsert_slots = asyncio.Semaphore(UPSERT_MAX_CONCURRENT)
+    results = await asyncio.gather(
+        *[process_pdf(pdf_path, collection, slots, upsert_slots) for pdf_path, collection in jobs],
+        return_exceptions=True
+    )
+    for (pdf_path, _), result in zip(jobs, results):
+        if isinstance(result, Exception):
+            print(f"✗ Failed to process {pdf_path}: {result}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
\ No newline at end of file
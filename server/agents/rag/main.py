@@ -1,4 +1,6 @@
 import os
+import json
+from pathlib import Path
 from typing import List, Dict, Optional
 import numpy as np
 from supabase import create_client
@@ -6,13 +8,15 @@ from langchain_cohere import CohereEmbeddings
 from langchain_groq import ChatGroq
 from langchain.memory import ConversationSummaryBufferMemory
 from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, SystemMessagePromptTemplate
-from langchain_core.runnables import RunnablePassthrough
 from dotenv import load_dotenv
 import asyncio
+import logging
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Initialize Supabase client
 supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
 
@@ -25,12 +29,23 @@ COLLECTIONS = {
     "Admission_Discharge": "Admission_Discharge",
     "Principles_Policies": "Principles_Policies"
 }
+COLLECTION_IDS = tuple(COLLECTIONS.values())
+
+EMBEDDING_MODEL = "embed-english-v3.0"
+
+# Collection name embeddings, persisted so restarts skip the embedding call
+COLLECTION_EMBEDDINGS_PATH = Path(__file__).parent / "collection_embeddings.json"
 
 class HospitalRAGSystem:
+    __slots__ = (
+        "embeddings", "llm", "memory", "system_prompt", "prompt", "chain",
+        "collection_embeddings"
+    )
+
     def __init__(self):
         # Initialize embeddings
         self.embeddings = CohereEmbeddings(
-            model="embed-english-v3.0",
+            model=EMBEDDING_MODEL,
             cohere_api_key=os.getenv("COHERE_API_KEY")
         )
         
@@ -41,13 +56,9 @@ class HospitalRAGSystem:
             groq_api_key=os.getenv("GROQ_API_KEY")
         )
         
-        # Initialize memory
+        # Initialize memory; summaries use the same client and connection pool
         self.memory = ConversationSummaryBufferMemory(
-            llm=ChatGroq(
-                model_name="gemma2-9b-it",
-                temperature=0,
-                groq_api_key=os.getenv("GROQ_API_KEY")
-            ),
+            llm=self.llm,
             memory_key="chat_history",
             max_token_limit=2000,
             return_messages=True
@@ -74,6 +85,56 @@ Response:"""
             )
         ])
 
+        # Built once; each turn only supplies the prompt's inputs
+        self.chain = self.prompt | self.llm
+
+        # Collection name embeddings, filled by initialize()
+        self.collection_embeddings = None
+
+    async def initialize(self):
+        """Embed every collection name in one request, once per agent"""
+        names = [collection_name.replace("_", " ") for collection_name in COLLECTIONS]
+        vectors = self._load_collection_embeddings(names)
+        if vectors is None:
+            # Same input type as aembed_query, so the vectors are unchanged
+            vectors = await self.embeddings.aembed(names, input_type="search_query")
+            self._save_collection_embeddings(names, vectors)
+        vectors = np.asarray(vectors)
+        # Unit rows, so one matrix product gives every cosine similarity
+        self.collection_embeddings = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def _load_collection_embeddings(self, names: List[str]) -> Optional[np.ndarray]:
+        """Stored embeddings for these names and model, or None"""
+        try:
+            with open(COLLECTION_EMBEDDINGS_PATH, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # A file of the wrong shape counts as a miss, never as an error
+        if not isinstance(stored, dict):
+            return None
+        if stored.get("model") != EMBEDDING_MODEL or stored.get("names") != names:
+            return None
+        try:
+            vectors = np.asarray(stored.get("vectors"), dtype=np.float64)
+        except (TypeError, ValueError):
+            return None
+        if vectors.ndim != 2 or len(vectors) != len(names):
+            return None
+        return vectors
+
+    def _save_collection_embeddings(self, names: List[str], vectors: List[List[float]]):
+        """Persist the collection name embeddings for the next start"""
+        # Written aside and swapped in, so an interrupted save never leaves
+        # a truncated file behind
+        partial_path = COLLECTION_EMBEDDINGS_PATH.with_suffix(".tmp")
+        try:
+            with open(partial_path, "w", encoding="utf-8") as f:
+                json.dump({"model": EMBEDDING_MODEL, "names": names, "vectors": vectors}, f)
+            partial_path.replace(COLLECTION_EMBEDDINGS_PATH)
+        except OSError as e:
+            logger.warning("Could not save collection embeddings: %s", e)
+
     def cosine_similarity(self, vecA: List[float], vecB: List[float]) -> float:
         """Calculate cosine similarity between two vectors"""
         dot_product = np.dot(vecA, vecB)
@@ -81,77 +142,79 @@ Response:"""
         magnitudeB = np.linalg.norm(vecB)
         return dot_product / (magnitudeA * magnitudeB)
 
-    async def get_relevant_collection(self, query: str) -> str:
+    async def get_relevant_collection(self, query: str,
+                                      query_embedding: Optional[List[float]] = None) -> str:
         """Determine the most relevant collection using embeddings"""
-        query_embedding = await self.embeddings.aembed_query(query)
-        best_match = "Admission_Discharge"  # Default collection
-        highest_score = -1
+        if self.collection_embeddings is None:
+            await self.initialize()
+        if query_embedding is None:
+            query_embedding = await self.embeddings.aembed_query(query)
+        query_vector = np.asarray(query_embedding)
+        scores = self.collection_embeddings @ (query_vector / np.linalg.norm(query_vector))
+        best = int(np.argmax(scores))
 
-        for collection_name, collection_id in COLLECTIONS.items():
-            collection_embedding = await self.embeddings.aembed_query(collection_name.replace("_", " "))
-            similarity = self.cosine_similarity(query_embedding, collection_embedding)
-            
-            if similarity > highest_score:
-                highest_score = similarity
-                best_match = collection_id
-
-        return best_match
+        # A degenerate (zero) query vector scores NaN; keep the default
+        if not scores[best] > -1:
+            return "Admission_Discharge"
+        return COLLECTION_IDS[best]
 
-    async def retrieve_documents(self, query: str, collection_name: str, k: int = 5) -> List[Dict]:
+    async def retrieve_documents(self, query: str, collection_name: str, k: int = 5,
+                                 query_embedding: Optional[List[float]] = None) -> List[Dict]:
         """Retrieve relevant documents from Supabase using vector search"""
-        query_embedding = await self.embeddings.aembed_query(query)
-        embedding_list = query_embedding.tolist() if hasattr(query_embedding, 'tolist') else list(query_embedding)
+        # aembed_query already returns a plain list of floats
+        if query_embedding is None:
+            query_embedding = await self.embeddings.aembed_query(query)
         
-        results = supabase.rpc('search_hospital_documents', {
-            'query_embedding': embedding_list,
+        # The Supabase client is synchronous; run the search in a thread so
+        # the router's event loop keeps serving other callers meanwhile
+        results = await asyncio.to_thread(supabase.rpc('search_hospital_documents', {
+            'query_embedding': query_embedding,
             'match_threshold': 0.7,
             'match_count': k,
             'collection_name': collection_name
-        }).execute()
+        }).execute)
         
         return results.data if results.data else []
 
-    async def generate_response(self, query: str, context: str) -> str:
+    async def generate_response(self, query: str, context: str, recent_history: str = "") -> str:
         """Generate response using the new Runnable approach"""
-        # Get chat history
-        memory_vars = self.memory.load_memory_variables({})
-        chat_history = memory_vars.get("chat_history", [])
-        recent_history = "\n".join([f"{msg.type}: {msg.content}" for msg in chat_history[-5:]]) if chat_history else ""
-        
-        # Create the chain
-        chain = (
-            RunnablePassthrough.assign(
-                chat_history=lambda _: recent_history,
-                context=lambda _: context
-            )
-            | self.prompt
-            | self.llm
-        )
-        
-        # Invoke the chain
-        response = await chain.ainvoke({"query": query})
+        response = await self.chain.ainvoke({
+            "query": query,
+            "chat_history": recent_history,
+            "context": context
+        })
         
         return response.content
 
+    async def answer(self, query: str, recent_history: str = "") -> str:
+        """Retrieve context and answer one query; errors propagate"""
+        # One embedding serves both collection choice and the search
+        query_embedding = await self.embeddings.aembed_query(query)
+        collection_name = await self.get_relevant_collection(query, query_embedding)
+        docs = await self.retrieve_documents(query, collection_name, query_embedding=query_embedding)
+        context = "\n".join([f"{i+1}. {doc['content']}" for i, doc in enumerate(docs)]) if docs else "No relevant documents found."
+        
+        return await self.generate_response(query, context, recent_history)
+
     async def handle_query(self, query: str) -> str:
-        """Handle RAG queries programmatically for router integration"""
+        """Answer within this instance's conversation, keeping its memory"""
         try:
             if query.lower() == "exit":
                 self.memory.clear()
                 return "Goodbye! Have a nice day."
             
-            collection_name = await self.get_relevant_collection(query)
-            docs = await self.retrieve_documents(query, collection_name)
-            context = "\n".join([f"{i+1}. {doc['content']}" for i, doc in enumerate(docs)]) if docs else "No relevant documents found."
+            # Get chat history
+            memory_vars = self.memory.load_memory_variables({})
+            chat_history = memory_vars.get("chat_history", [])
+            recent_history = "\n".join([f"{msg.type}: {msg.content}" for msg in chat_history[-5:]]) if chat_history else ""
             
-            response = await self.generate_response(query, context)
+            response = await self.answer(query, recent_history)
             self.memory.save_context({"query": query}, {"text": response})
             
             return response
             
         except Exception as e:
-            import traceback
-            traceback.print_exc()
+            logger.exception("RAG query failed")
             self.memory.clear()
             return f"Sorry, I encountered an error: {str(e)}"
 
@@ -164,13 +227,21 @@ async def handle_query(query: str) -> str:
     Returns:
         str: The agent's response
     """
-    try:
-        # Create new instance for each query to ensure clean state
-        rag_system = HospitalRAGSystem()
-        response = await rag_system.handle_query(query)
-        return response
-    except Exception as e:
-        return f"Information system error: {str(e)}. Please try again later."
+    if query.lower() == "exit":
+        return "Goodbye! Have a nice day."
+    # The router has no sessions, so each query is answered on its own:
+    # only the stateless clients are shared, never conversation memory.
+    # Errors propagate so the router never caches them as answers.
+    return await get_agent().answer(query)
+
+rag_system_instance = None
+
+def get_agent() -> HospitalRAGSystem:
+    """Get the agent instance for routing system"""
+    global rag_system_instance
+    if rag_system_instance is None:
+        rag_system_instance = HospitalRAGSystem()
+    return rag_system_instance
 
 # Preserve original chat loop for testing
 async def chat_loop():
@@ -1,6 +1,13 @@
 import re
 from ...functions.create_prompt import create_prompt
 
+AGE_PROMPT = (
+    "Extract the numeric age from the input. "
+    "Return only the number without any explanations, context, or additional text. "
+    "Do NOT include any reasoning, interpretations, or words—ONLY the number."
+)
+NUMBER_PATTERN = re.compile(r"\d+")
+
 def get_age() -> int:
     """
     Extracts the age from the user input, ensuring it is a valid number between 1 and 100.
@@ -14,15 +21,10 @@ def get_age() -> int:
             continue
 
        
-        age_extracted = create_prompt(
-            "Extract the numeric age from the input. "
-            "Return only the number without any explanations, context, or additional text. "
-            "Do NOT include any reasoning, interpretations, or words—ONLY the number.",
-            user_input
-        ).strip()
+        age_extracted = create_prompt(AGE_PROMPT, user_input).strip()
 
        
-        extracted_numbers = re.findall(r"\d+", age_extracted)
+        extracted_numbers = NUMBER_PATTERN.findall(age_extracted)
         if extracted_numbers:
             age = int(extracted_numbers[0]) 
 
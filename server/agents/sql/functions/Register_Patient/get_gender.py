@@ -1,5 +1,20 @@
 from ...functions.create_prompt import create_prompt
 
+GENDER_PROMPT = (
+    "Extract the gender from the given input. "
+    "User can say 'Male', 'Female', or 'Prefer not to say'. "
+    "Return exactly 'M' for Male, 'F' for Female, or 'N' for Prefer not to say. "
+    "If the input does not match these categories, return 'Invalid'. "
+    "Do not return any other words or explanations."
+)
+
+# Answers recognised directly when the model returns 'Invalid'
+GENDER_FALLBACKS = {
+    "male": "M", "m": "M",
+    "female": "F", "f": "F",
+    "prefer not to say": "N", "prefer not": "N",
+}
+
 def get_gender() -> str:
     """
     Extracts the gender (Male, Female, or Prefer not to say).
@@ -14,23 +29,13 @@ def get_gender() -> str:
             continue
 
         # Use AI to extract gender
-        gender_extracted = create_prompt(
-            "Extract the gender from the given input. "
-            "User can say 'Male', 'Female', or 'Prefer not to say'. "
-            "Return exactly 'M' for Male, 'F' for Female, or 'N' for Prefer not to say. "
-            "If the input does not match these categories, return 'Invalid'. "
-            "Do not return any other words or explanations.",
-            user_input
-        ).strip().upper()
+        gender_extracted = create_prompt(GENDER_PROMPT, user_input).strip().upper()
 
        
         if gender_extracted == "INVALID":
-            if user_input in {"male", "m"}:
-                return "M"
-            elif user_input in {"female", "f"}:
-                return "F"
-            elif user_input in {"prefer not to say", "prefer not"}:
-                return "N"
+            gender = GENDER_FALLBACKS.get(user_input)
+            if gender is not None:
+                return gender
 
             print("Agent: Not a valid gender. Please say 'Male', 'Female', or 'Prefer not to say'.")
             continue
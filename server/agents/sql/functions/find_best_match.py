@@ -1,6 +1,11 @@
+import logging
 from ..connection import supabase
 from rapidfuzz import process
 
+logger = logging.getLogger(__name__)
+
+# Minimum similarity score for a doctor name to count as a match
+MATCH_THRESHOLD = 70
 
 def find_best_match(input_name: str) -> str:
     """
@@ -9,7 +14,6 @@ def find_best_match(input_name: str) -> str:
     :param input_name: The name to search for.
     :return: The best matching doctor name or an empty string if no match is found.
     """
-    threshold = 70
     try:
         # Fetch all doctor names from Supabase
         response = supabase.table("doctors").select("name").execute()
@@ -19,12 +23,13 @@ def find_best_match(input_name: str) -> str:
 
         doctor_names = [doc["name"] for doc in response.data]
 
-        best_match, score, _ = process.extractOne(input_name, doctor_names) if doctor_names else (None, 0, None)
+        # The cutoff lets rapidfuzz skip candidates that cannot reach it
+        match = process.extractOne(input_name, doctor_names, score_cutoff=MATCH_THRESHOLD)
 
-        return best_match if score >= threshold else ""
+        return match[0] if match else ""
 
     except Exception as e:
-        print(f"Error: {e}")  # Log the error
+        logger.error("Doctor name lookup failed: %s", e)
         return ""  # Return an empty string in case of any exception
 
 __all__ = ["find_best_match"]
@@ -11,8 +11,16 @@ from .tools.register_patient import register_patient_tool
 from .tools.appointmentSlots_info import appointment_slotsInfo_tool
 from langchain_core.messages import SystemMessage
 import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Inputs that end the conversation and clear its memory
+EXIT_WORDS = frozenset({"bye", "exit", "goodbye"})
 
 class SQLAgent:
+    __slots__ = ("tools", "memory", "agent_executor")
+
     def __init__(self):
         # Initialize tools
         self.tools = self._initialize_tools()
@@ -61,7 +69,8 @@ class SQLAgent:
             agent=agent,
             tools=self.tools,
             memory=self.memory,
-            verbose=True,
+            # Step-by-step tracing only when debug logging is on
+            verbose=logger.isEnabledFor(logging.DEBUG),
             handle_parsing_errors=True,
             return_intermediate_steps=True,
             max_iterations=5  # Prevent infinite loops
@@ -70,17 +79,17 @@ class SQLAgent:
     async def handle_query(self, query: str) -> str:
         """Handle incoming queries with enhanced response parsing"""
         try:
-            if query.lower() in ["bye", "exit", "goodbye"]:
+            if query.lower() in EXIT_WORDS:
                 self.memory.clear()
                 return "Goodbye! Have a nice day."
             
-            memory_vars = self.memory.load_memory_variables({})
-            if not isinstance(memory_vars.get("chat_history", []), list):
+            chat_history = self.memory.load_memory_variables({}).get("chat_history", [])
+            if not isinstance(chat_history, list):
                 self.memory.clear()
                 
             response = await self.agent_executor.ainvoke({
                 "input": query,
-                "chat_history": memory_vars.get("chat_history", [])
+                "chat_history": chat_history
             })
             
             # Enhanced response extraction
@@ -88,12 +97,12 @@ class SQLAgent:
                 return response.get("output", response.get("result", "I didn't get a proper response."))
             return str(response)
             
-        except Exception as e:
+        except Exception:
+            # Raised, not turned into a "try again" reply: a booking or
+            # cancellation may already have been applied when this fails
+            logger.error("SQL agent query failed", exc_info=True)
             self.memory.clear()
-            error_msg = str(e)
-            if "400" in error_msg or "message" in error_msg.lower():
-                return "Sorry, I'm having trouble processing your request. Please try again."
-            return f"System error: {error_msg}. Please try again."
+            raise
 
 # Router-compatible interface
 async def handle_query(query: str) -> str:
@@ -104,26 +113,20 @@ async def handle_query(query: str) -> str:
     Returns:
         str: The agent's response
     """
-    # Initialize agent if not already done
-    if 'sql_agent_instance' not in globals():
-        global sql_agent_instance
-        sql_agent_instance = SQLAgent()
-    
-    try:
-        response = await sql_agent_instance.handle_query(query)
-        return response
-    except Exception as e:
-        return f"Appointment system error: {str(e)}. Please try again later."
+    return await get_agent().handle_query(query)
+
+sql_agent_instance = None
 
 def get_agent() -> SQLAgent:
     """Get the agent instance for routing system"""
-    if 'sql_agent_instance' not in globals():
-        global sql_agent_instance
+    global sql_agent_instance
+    if sql_agent_instance is None:
         sql_agent_instance = SQLAgent()
     return sql_agent_instance
 
-if __name__ == "__main__":
-    # Test mode (unchanged)
+# Test mode, one event loop for the whole conversation
+async def chat_loop():
+    """Standalone testing mode"""
     print("Appointment Management Agent - Test Mode")
     print("Type 'exit' to end the session\n")
     
@@ -138,12 +141,15 @@ if __name__ == "__main__":
                 print("Agent: Goodbye!")
                 break
                 
-            response = asyncio.run(agent.handle_query(user_input))
+            response = await agent.handle_query(user_input)
             print(f"Agent: {response}")
             
         except KeyboardInterrupt:
             print("\nSession ended by user")
             break
         except Exception as e:
-            print(f"Critical error: {str(e)}")
-            break
\ No newline at end of file
+            print(f"Agent: Sorry, we couldn't confirm that request ({str(e)}). "
+                  "Please check your appointments before trying again.")
+
+if __name__ == "__main__":
+    asyncio.run(chat_loop())
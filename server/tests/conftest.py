@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# router.py and the agents package live in server/, not in an installed package
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,105 @@
+import asyncio
+import random
+import re
+
+import pytest
+
+import router
+
+
+class FakeLLM:
+    """Stand-in for router._complete that labels queries by their words"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.requests = []
+
+    @staticmethod
+    def label(query: str) -> str:
+        return "MEDICAL" if "wibble" in query else "GENERAL"
+
+    async def __call__(self, messages: list, max_tokens: int = 10) -> str:
+        content = messages[-1]["content"]
+        self.requests.append(content)
+        await asyncio.sleep(self.delay)
+        numbered = [line.partition(") ") for line in content.splitlines()]
+        if len(numbered) > 1 or numbered[0][0].isdigit():
+            return "\n".join(f"{number}) {self.label(query)}" for number, _, query in numbered)
+        return self.label(content)
+
+
+@pytest.fixture
+def hospital_router(monkeypatch, tmp_path):
+    monkeypatch.setattr(router, "CLASSIFICATION_CACHE_PATH", tmp_path / "classification_cache.json")
+    return router.HospitalRouter()
+
+
+def reference_fast_path(matrix: dict, query_lower: str):
+    """The original per-category loop: emergency keywords, then keywords and patterns in order"""
+    if any(keyword in query_lower for keyword in matrix["EMERGENCY"]["keywords"]):
+        return "FAST_EMERGENCY"
+    for category, config in matrix.items():
+        if category == "EMERGENCY":
+            continue
+        if any(keyword in query_lower for keyword in config["keywords"]):
+            return f"FAST_{category}"
+        if any(re.search(pattern, query_lower, re.IGNORECASE) for pattern in config["patterns"]):
+            return f"REGEX_{category}"
+    return None
+
+
+def test_fast_path_matches_reference(hospital_router):
+    matrix = hospital_router.routing_matrix
+    words = [keyword for config in matrix.values() for keyword in config["keywords"]]
+    words += ("book schedule see dr. doctor with what should i do for is serious treatment "
+              "my child son fever guide details hours pay cancel rash the a x").split()
+    rng = random.Random(2)
+    for _ in range(20000):
+        # Up to 30 words, so long queries take the linear-time scans too
+        query = " ".join(rng.choice(words) for _ in range(rng.randint(1, 30))).lower()
+        result = hospital_router._classify_fast(query, 0.0)
+        assert (result[3] if result else None) == reference_fast_path(matrix, query), query
+
+
+def test_concurrent_queries_share_one_llm_batch(hospital_router, monkeypatch):
+    llm = FakeLLM(delay=0.05)
+    monkeypatch.setattr(router, "_complete", llm)
+
+    async def run():
+        queries = [f"blorp {i} wibble" for i in range(5)] + ["blorp quux"]
+        results = await asyncio.gather(*[hospital_router.classify_query(q) for q in queries])
+        await hospital_router.aclose()
+        return results
+
+    results = asyncio.run(run())
+    assert [result[3] for result in results] == ["LLM_MEDICAL"] * 5 + ["LLM_GENERAL"]
+    assert len(llm.requests) == 1
+
+
+def test_identical_queries_share_one_llm_answer(hospital_router, monkeypatch):
+    llm = FakeLLM(delay=0.05)
+    monkeypatch.setattr(router, "_complete", llm)
+
+    async def run():
+        results = await asyncio.gather(*[hospital_router.classify_query("Blorp wibble?") for _ in range(4)])
+        await hospital_router.aclose()
+        return results
+
+    results = asyncio.run(run())
+    assert {result[3] for result in results} == {"LLM_MEDICAL"}
+    assert llm.requests == ["Blorp wibble?"]
+
+
+def test_aclose_fails_pending_llm_callers(hospital_router, monkeypatch):
+    monkeypatch.setattr(router, "_complete", FakeLLM(delay=30))
+    # More queries than one batch holds, so some are still queued at close
+    queries = [f"blorp {i} quux" for i in range(router.LLM_BATCH_SIZE * 3)]
+
+    async def run():
+        tasks = [asyncio.create_task(hospital_router.classify_query(q)) for q in queries]
+        await asyncio.sleep(0.2)
+        await hospital_router.aclose()
+        return await asyncio.wait_for(asyncio.gather(*tasks), timeout=2)
+
+    results = asyncio.run(run())
+    assert {result[3] for result in results} == {"FALLBACK"}